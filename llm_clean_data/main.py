@@ -1,7 +1,20 @@
 import os
+import ast
+import json
+import io
+import hashlib
+import tempfile
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, redirect_stdout
+from functools import partial
 import google.generativeai as genai
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import argparse
 
 # Load environment variables from .env file
@@ -12,49 +25,52 @@ GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 if not GOOGLE_API_KEY:
     raise ValueError("Please set GOOGLE_API_KEY in .env file")
 genai.configure(api_key=GOOGLE_API_KEY)
+# Models can be overridden in the .env file when Google retires the defaults
+MODEL_NAME = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+EMBEDDING_MODEL = os.getenv('GEMINI_EMBEDDING_MODEL', 'models/gemini-embedding-001')
 
-def identify_placeholder_strings(df, columns_to_check):
-    """
-    Use Gemini Pro to identify potential placeholder strings in specified columns
-    
-    Args:
-        df (pd.DataFrame): Input DataFrame
-        columns_to_check (list): List of column names to analyze
-        sample_size (int): Number of rows to sample
-    """
-    # Validate columns exist in DataFrame
-    invalid_cols = [col for col in columns_to_check if col not in df.columns]
-    if invalid_cols:
-        raise ValueError(f"Columns not found in DataFrame: {invalid_cols}")
-    
-    # Sample the DataFrame
-    sample_df = df[columns_to_check]
-    
-    # Get value counts for specified columns
-    value_counts = {}
-    for col in columns_to_check:
-        # Convert to string to capture all values
-        series = sample_df[col].astype(str)
-        # Get all value counts
-        counts = series.value_counts()
-        # Only include columns that have some non-numeric values
-        if any(~counts.index.str.match(r'^[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?$')):
-            # Limit numeric values to top 5 to avoid overwhelming the prompt
-            numeric_mask = counts.index.str.match(r'^[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?$')
-            numeric_counts = counts[numeric_mask].head(5)
-            non_numeric_counts = counts[~numeric_mask]
-            # Combine both with a clear separator
-            value_counts[col] = {
-                'numeric_examples': numeric_counts.to_dict(),
-                'non_numeric_values': non_numeric_counts.to_dict()
-            }
-    
-    prompt = """
+# Bump whenever the prompt changes so cached responses are invalidated
+PROMPT_VERSION = b'3'
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'llm_clean_data')
+SEMANTIC_CACHE_PATH = os.path.join(CACHE_DIR, 'semantic.sqlite')
+# Semantic entries only match within the same prompt, model and embedding space
+SEMANTIC_CACHE_VERSION = f"{PROMPT_VERSION.decode()}:{MODEL_NAME}:{EMBEDDING_MODEL}"
+COLUMN_CACHE_PATH = os.path.join(CACHE_DIR, 'col_index.sqlite')
+# Minimum cosine similarity for a cached column signature to be reused
+SEMANTIC_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL = 30 * 24 * 60 * 60  # seconds
+# Row count above which --format auto writes Parquet instead of the input format
+PARQUET_MIN_ROWS = 100_000
+# Prompt size per request and number of requests sent to Gemini at once
+MAX_BATCH_TOKENS = 1500
+MAX_CONCURRENT_REQUESTS = 8
+# Number of files processed at once when several files are given
+MAX_WORKERS = 8
+# Non-numeric values per column included in the prompt, and the minimum
+# frequency of the most common one for the column to be analyzed at all
+MAX_NON_NUMERIC_VALUES = 50
+MIN_PLACEHOLDER_COUNT = 2
+# Common placeholders (compared stripped and lowercased) that need no LLM call
+KNOWN_PLACEHOLDERS = frozenset({
+    'n/a', 'na', 'nan', 'null', 'none', '-', '--', 'unknown', 'missing',
+    'blod', 'm_other', 'not_answered', '',
+})
+KNOWN_PLACEHOLDER_ARRAY = pa.array(sorted(KNOWN_PLACEHOLDERS))
+NUMERIC_PATTERN = r'^[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?$'
+# Constrain Gemini to return a JSON array of strings
+GENERATION_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': {'type': 'array', 'items': {'type': 'string'}},
+}
+# Shared by every request so the model and its generation config are set up once
+MODEL = genai.GenerativeModel(MODEL_NAME, generation_config=GENERATION_CONFIG)
+
+PLACEHOLDER_PROMPT = """
     ## Task:
     Analyze these columns and their unique value counts. Each column has:
     - 'numeric_examples': A sample of the normal numeric values in the column (may be empty for only categorical columns)
-    - 'non_numeric_values': All non-numeric values found in the column
-    
+    - 'non_numeric_values': The most frequent non-numeric values found in the column
+
     Identify ONLY placeholder strings that represent missing data or invalid measurements.
 
     ## Rules for Identification:
@@ -66,97 +82,628 @@ def identify_placeholder_strings(df, columns_to_check):
     Examples of what to exclude:
     - Valid categorical values (e.g., 'Male'/'Female')
     - Normal numeric values
-    
+
     ## Special Considerations
     1. Numeric columns: If a column has numeric values, then most non-numeric values in the columnare likely placeholders
     2. Categorical columns: Consider all categorical values and decide if they are valid or placeholders for the column values
        - Focus on common missing data patterns
        - Consider the column name and context
-    
+
     ## Output Format
-    Return a Python list of strings containing only the identified placeholder values.
+    Return a JSON array of strings containing only the identified placeholder values.
     Include case variations if present.
     """
+
+# Appended to the prompt when retrying after an unparseable response
+RETRY_PROMPT_SUFFIX = """
+    Your previous response could not be parsed. Respond with ONLY a JSON array of strings,
+    for example ["N/A", "missing"], with no other text, comments or formatting.
+    """
+
+def _cache_path(value_counts):
+    """
+    Build the cache file path for a value counts dict
+    
+    Args:
+        value_counts (dict): Per-column value counts sent to Gemini
+    """
+    # Sorted (column, counts) pairs give a stable key across runs and Python versions.
+    # Column names are stringified first, since headers like ['Sex', 2019] can't be sorted
+    items = sorted((str(col), counts) for col, counts in value_counts.items())
+    payload = json.dumps(items, sort_keys=True).encode() + PROMPT_VERSION
+    key = hashlib.blake2b(payload).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def _save_cache(path, placeholders):
+    """
+    Atomically write placeholder strings to the cache
+    
+    Args:
+        path (str): Cache file path
+        placeholders (list): Placeholder strings returned by Gemini
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write to a temp file and rename so concurrent readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(placeholders, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def _embed_signature(value_counts):
+    """
+    Embed the non-numeric vocabulary of each column into one normalized vector
+    
+    Args:
+        value_counts (dict): Per-column value counts sent to Gemini
+    """
+    # One document per column: its sorted non-numeric values joined by '|'
+    documents = ['|'.join(sorted(counts['non_numeric_values'])) for counts in value_counts.values()]
+    result = genai.embed_content(model=EMBEDDING_MODEL, content=documents)
+    # Mean-pool the column embeddings and L2-normalize so dot product is cosine similarity
+    embedding = np.asarray(result['embedding'], dtype=np.float32).mean(axis=0)
+    return embedding / np.linalg.norm(embedding)
+
+def _connect_semantic_cache():
+    """
+    Open the semantic cache database, creating it if needed
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(SEMANTIC_CACHE_PATH, timeout=30)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS signatures '
+        '(embedding BLOB, placeholders TEXT, created REAL, version TEXT)'
+    )
+    # Databases from before entries were versioned get the column added; their
+    # rows have no version, so they never match and expire with the TTL
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(signatures)')]
+    if 'version' not in columns:
+        conn.execute('ALTER TABLE signatures ADD COLUMN version TEXT')
+    return conn
+
+def _lookup_semantic_cache(embedding):
+    """
+    Return the placeholders of the most similar cached signature, if similar enough
+    
+    Args:
+        embedding (np.ndarray): Normalized signature embedding
+    """
+    with closing(_connect_semantic_cache()) as conn, conn:
+        conn.execute('DELETE FROM signatures WHERE created < ?', (time.time() - SEMANTIC_CACHE_TTL,))
+        rows = conn.execute(
+            'SELECT embedding, placeholders FROM signatures WHERE version = ?',
+            (SEMANTIC_CACHE_VERSION,)
+        ).fetchall()
+    if not rows:
+        return None
+    
+    cached = np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+    similarities = cached @ embedding
+    best = int(np.argmax(similarities))
+    if similarities[best] < SEMANTIC_THRESHOLD:
+        return None
+    print(f"Using semantically cached response (similarity {similarities[best]:.3f})")
+    return json.loads(rows[best][1])
+
+def _save_semantic_cache(embedding, placeholders):
+    """
+    Store a signature embedding with its placeholder strings
+    
+    Args:
+        embedding (np.ndarray): Normalized signature embedding
+        placeholders (list): Placeholder strings returned by Gemini
+    """
+    with closing(_connect_semantic_cache()) as conn, conn:
+        conn.execute(
+            'INSERT INTO signatures (embedding, placeholders, created, version) VALUES (?, ?, ?, ?)',
+            (embedding.astype(np.float32).tobytes(), json.dumps(placeholders), time.time(), SEMANTIC_CACHE_VERSION)
+        )
+
+def _column_fingerprint(col, counts):
+    """
+    Build the column cache key for one column's value counts
+    
+    Args:
+        col (str): Column name
+        counts (dict): The column's numeric examples and non-numeric values
+    """
+    # Key on the non-numeric vocabulary rather than the counts, so the same
+    # column in another file of a different size still matches
+    payload = json.dumps(
+        [str(col), sorted(counts['non_numeric_values']), bool(counts['numeric_examples'])]
+    ).encode() + PROMPT_VERSION
+    return hashlib.blake2b(payload).hexdigest()
+
+def _connect_column_cache():
+    """
+    Open the per-column cache database, creating it if needed
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(COLUMN_CACHE_PATH, timeout=30)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS columns '
+        '(fingerprint TEXT PRIMARY KEY, placeholders TEXT)'
+    )
+    return conn
+
+def _lookup_column_cache(value_counts):
+    """
+    Split value counts into placeholders of cached columns and the uncached columns
+    
+    Args:
+        value_counts (dict): Per-column value counts sent to Gemini
+    """
+    fingerprints = {col: _column_fingerprint(col, counts) for col, counts in value_counts.items()}
+    with closing(_connect_column_cache()) as conn:
+        rows = conn.execute(
+            f'SELECT fingerprint, placeholders FROM columns WHERE fingerprint IN ({",".join("?" * len(fingerprints))})',
+            list(fingerprints.values())
+        ).fetchall()
+    cached = dict(rows)
+    
+    placeholders = set()
+    missing_counts = {}
+    for col, counts in value_counts.items():
+        if fingerprints[col] in cached:
+            placeholders.update(json.loads(cached[fingerprints[col]]))
+        else:
+            missing_counts[col] = counts
+    if len(missing_counts) < len(value_counts):
+        print(f"Using cached placeholders for {len(value_counts) - len(missing_counts)} of {len(value_counts)} columns")
+    return placeholders, missing_counts
+
+def _save_column_cache(value_counts, placeholders):
+    """
+    Attribute placeholder strings back to the columns they occur in and store them per column
+    
+    Args:
+        value_counts (dict): Per-column value counts sent to Gemini
+        placeholders (list): Placeholder strings identified for these columns
+    """
+    # Compare the same way as _placeholder_mask so 'N/A' is attributed to a column holding 'n/a '
+    normalized_placeholders = {p.strip().lower() for p in placeholders}
+    rows = []
+    for col, counts in value_counts.items():
+        col_placeholders = sorted(
+            value for value in counts['non_numeric_values']
+            if value.strip().lower() in normalized_placeholders
+        )
+        rows.append((_column_fingerprint(col, counts), json.dumps(col_placeholders)))
+    with closing(_connect_column_cache()) as conn, conn:
+        conn.executemany('INSERT OR REPLACE INTO columns VALUES (?, ?)', rows)
+
+def _batch_value_counts(value_counts):
+    """
+    Split value counts into batches of columns that fit a prompt token budget
+    
+    Args:
+        value_counts (dict): Per-column value counts sent to Gemini
+    """
+    batches = []
+    batch, batch_tokens = {}, 0
+    for col, counts in value_counts.items():
+        # Rough estimate of ~4 characters per token
+        col_tokens = len(json.dumps({col: counts})) // 4
+        if batch and batch_tokens + col_tokens > MAX_BATCH_TOKENS:
+            batches.append(batch)
+            batch, batch_tokens = {}, 0
+        batch[col] = counts
+        batch_tokens += col_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _parse_placeholder_response(text):
+    """
+    Parse a Gemini response into a list of placeholder strings
+    
+    Args:
+        text (str): Response text, expected to be a JSON array of strings
+    """
+    try:
+        try:
+            placeholders = json.loads(text)
+        except json.JSONDecodeError:
+            # Legacy responses may be a Python list literal instead of JSON
+            placeholders = ast.literal_eval(text.strip())
+    except Exception as e:
+        # literal_eval can also raise TypeError, MemoryError or RecursionError;
+        # report every parse failure the same way so callers can fall back
+        raise ValueError(f"Could not parse response: {text!r}") from e
+    # Reject schema violations instead of stringifying them, so e.g. [1, null]
+    # can't turn every numeric 1 into a placeholder
+    if not isinstance(placeholders, list) or not all(isinstance(item, str) for item in placeholders):
+        raise ValueError(f"Expected a list of placeholder strings, got: {text}")
+    return placeholders
+
+def _query_batch(model, batch):
+    """
+    Ask Gemini for the placeholder strings in one batch of columns
+    
+    Args:
+        model (genai.GenerativeModel): Gemini model
+        batch (dict): Value counts for a subset of columns
+    
+    Returns None if the request fails or the response can't be parsed, even after one retry
+    """
+    prompt = f"{PLACEHOLDER_PROMPT}\n\nColumn value counts:\n{batch}"
+    for attempt_prompt in (prompt, prompt + RETRY_PROMPT_SUFFIX):
+        text = None
+        try:
+            response = model.generate_content(attempt_prompt)
+            # .text raises ValueError when the candidate was blocked and has no parts
+            text = response.text
+            print(f"Response for columns {list(batch)}: \n", text)
+            if not text.strip():
+                raise ValueError("Empty response")
+            return _parse_placeholder_response(text)
+        except Exception as e:
+            # An API error only loses this batch, like an unparseable reply
+            print(f"Could not get placeholders for columns {list(batch)} ({e}): {text!r}")
+    
+    # Drop the failed batch and fall back to the built-in placeholders
+    print(f"Falling back to known placeholders for columns {list(batch)}")
+    return None
+
+def _query_batches(batches):
+    """
+    Query all batches concurrently, respecting the request rate limit
+    
+    Args:
+        batches (list): List of value counts dicts, one per request
+    """
+    # Blocking calls on a thread pool rather than asyncio: the SDK caches its async
+    # client per process, bound to the first event loop, so a second asyncio.run()
+    # in the same process would fail, and asyncio.run() can't be nested in notebooks
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        return list(executor.map(partial(_query_batch, MODEL), batches))
+
+def _query_schema(value_counts, use_cache=True):
+    """
+    Get placeholder strings for a set of columns from the cache or from Gemini
+    
+    Args:
+        value_counts (dict): Per-column value counts sent to Gemini
+        use_cache (bool): Reuse cached Gemini responses for identical or similar value counts
+    """
+    # Return cached response if these exact value counts were analyzed before
+    if use_cache:
+        cache_path = _cache_path(value_counts)
+        if os.path.exists(cache_path):
+            print(f"Using cached response: {cache_path}")
+            with open(cache_path) as f:
+                return json.load(f)
+    
+    # Fall back to a near-duplicate schema with the same placeholder vocabulary.
+    # The semantic cache is optional, so an embedding or database error only skips it
+    embedding = None
+    if use_cache:
+        try:
+            embedding = _embed_signature(value_counts)
+            placeholders = _lookup_semantic_cache(embedding)
+        except Exception as e:
+            print(f"Skipping semantic cache: {str(e)}")
+            embedding, placeholders = None, None
+        # An approximate match is never copied into the exact cache, which has
+        # no TTL and would otherwise keep another file's answer forever
+        if placeholders is not None:
+            return placeholders
+    
+    # Send batches of columns in parallel and merge the identified placeholders
+    batches = _batch_value_counts(value_counts)
+    results = _query_batches(batches)
+    placeholders = sorted(set().union(*(result for result in results if result is not None)))
+    
+    # Don't cache an incomplete answer so the failed batches are retried next run
+    if use_cache and None not in results:
+        _save_cache(cache_path, placeholders)
+        if embedding is not None:
+            try:
+                _save_semantic_cache(embedding, placeholders)
+            except Exception as e:
+                print(f"Could not update semantic cache: {str(e)}")
+        # Only Gemini's own answers are attributed per column, never a
+        # near-duplicate schema's answer reused from the semantic cache
+        _save_column_cache(value_counts, placeholders)
+    return placeholders
+
+def _query_placeholders(value_counts, use_cache=True):
+    """
+    Get placeholder strings for value counts, only querying columns not seen before
+    
+    Args:
+        value_counts (dict): Per-column value counts sent to Gemini
+        use_cache (bool): Reuse cached Gemini responses for identical or similar value counts
+    """
+    if not use_cache:
+        return _query_schema(value_counts, use_cache=False)
+    
+    # Columns already analyzed in any earlier run are answered per column
+    cached_placeholders, missing_counts = _lookup_column_cache(value_counts)
+    if not missing_counts:
+        return sorted(cached_placeholders)
+    
+    placeholders = _query_schema(missing_counts)
+    return sorted(cached_placeholders.union(placeholders))
+
+def identify_placeholder_strings(df, columns_to_check, use_cache=True):
+    """
+    Use Gemini to identify potential placeholder strings in specified columns
+    
+    Args:
+        df (pd.DataFrame): Input DataFrame
+        columns_to_check (list): List of column names to analyze
+        use_cache (bool): Reuse cached Gemini responses for identical or similar value counts
+    """
+    # Validate columns exist in DataFrame
+    invalid_cols = [col for col in columns_to_check if col not in df.columns]
+    if invalid_cols:
+        raise ValueError(f"Columns not found in DataFrame: {invalid_cols}")
+    
+    # Convert once to an Arrow table of strings so the scans below run in Arrow's compute kernels
+    table = pa.Table.from_pandas(df[columns_to_check].astype("string[pyarrow]"), preserve_index=False)
+    
+    # Get value counts for the columns that need Gemini, resolving
+    # well-known placeholders locally
+    value_counts = {}
+    known_placeholders = set()
+    for col, column in zip(columns_to_check, table.columns):
+        # Count values with Arrow's hash kernel, dropping missing values and
+        # sorting by descending count (stable, like Series.value_counts)
+        counts = pc.value_counts(column)
+        counts = counts.filter(pc.is_valid(counts.field('values')))
+        counts = counts.take(pc.sort_indices(counts.field('counts'), sort_keys=[('', 'descending')]))
+        values, frequencies = counts.field('values'), counts.field('counts')
+        # Match the unique values directly with Arrow's regex kernel
+        numeric_mask = pc.match_substring_regex(values, NUMERIC_PATTERN)
+        non_numeric_mask = pc.invert(numeric_mask)
+        non_numeric_values = values.filter(non_numeric_mask)
+        non_numeric_frequencies = frequencies.filter(non_numeric_mask)
+        
+        # Well-known placeholders are collected locally whatever their frequency
+        normalized = pc.utf8_lower(pc.utf8_trim_whitespace(non_numeric_values))
+        known_mask = pc.is_in(normalized, value_set=KNOWN_PLACEHOLDER_ARRAY)
+        known_placeholders.update(non_numeric_values.filter(known_mask).to_pylist())
+        
+        # Placeholders are frequent by nature, so only columns with a repeated
+        # unknown non-numeric value need Gemini
+        unknown_frequencies = non_numeric_frequencies.filter(pc.invert(known_mask))
+        if len(unknown_frequencies) == 0 or unknown_frequencies[0].as_py() < MIN_PLACEHOLDER_COUNT:
+            continue
+        # Keep only the most common non-numeric values and the top 5 numeric
+        # values to avoid overwhelming the prompt
+        non_numeric_counts = dict(zip(
+            non_numeric_values[:MAX_NON_NUMERIC_VALUES].to_pylist(),
+            non_numeric_frequencies[:MAX_NON_NUMERIC_VALUES].to_pylist()
+        ))
+        numeric_counts = dict(zip(
+            values.filter(numeric_mask)[:5].to_pylist(),
+            frequencies.filter(numeric_mask)[:5].to_pylist()
+        ))
+        # Combine both with a clear separator
+        value_counts[col] = {
+            'numeric_examples': numeric_counts,
+            'non_numeric_values': non_numeric_counts
+        }
+    
+    if not value_counts:
+        if known_placeholders:
+            print("Only known placeholders and one-off values found, skipping Gemini")
+        else:
+            print("No candidate placeholder values found, skipping Gemini")
+        return sorted(known_placeholders)
+    
+    placeholders = _query_placeholders(value_counts, use_cache)
+    return sorted(known_placeholders.union(placeholders))
+
+def _normalize_placeholders(placeholders):
+    """
+    Build the set of placeholder strings compared against cell values
     
-    model = genai.GenerativeModel('gemini-pro')
-    response = model.generate_content(f"{prompt}\n\nColumn value counts:\n{value_counts}")
-    print("Response: \n", response.text)
-    return eval(response.text)
+    Args:
+        placeholders (iterable): Placeholder strings
+    """
+    # Stripped and lowercased so variants like 'N/A ' or 'n/a' match the identified 'N/A'
+    return frozenset(p.strip().lower() for p in placeholders)
 
-def clean_dataframe(df, placeholder_list, columns_to_clean):
+def _placeholder_mask(df, columns, placeholder_set):
+    """
+    Flag cells of a DataFrame that match a placeholder string, ignoring case and surrounding whitespace
+    
+    Args:
+        df (pd.DataFrame): Input DataFrame
+        columns (list): Columns to check
+        placeholder_set (frozenset): Normalized placeholder strings from _normalize_placeholders
+    """
+    value_set = pa.array(sorted(placeholder_set), type=pa.string())
+    masks = []
+    for col in columns:
+        # Convert one column at a time to Arrow strings, so only a single column
+        # copy is alive; the original values are kept as-is
+        values = pa.array(df[col].astype("string[pyarrow]"))
+        # Normalize only the unique values, then flag the rows holding a matching one
+        uniques = pc.unique(values)
+        normalized = pc.utf8_lower(pc.utf8_trim_whitespace(uniques))
+        matches = uniques.filter(pc.is_in(normalized, value_set=value_set))
+        masks.append(pc.is_in(values, value_set=matches).to_numpy(zero_copy_only=False))
+    mask = pd.DataFrame(dict(enumerate(masks)), index=df.index)
+    mask.columns = columns
+    return mask
+
+def clean_dataframe(df, placeholders, columns_to_clean):
     """
     Replace identified placeholder strings with NaN in specified columns
     
     Args:
         df (pd.DataFrame): Input DataFrame
-        placeholder_list (list): List of strings to replace with NaN
+        placeholders (iterable): Strings to replace with NaN, matched ignoring case and surrounding whitespace
         columns_to_clean (list): List of column names to clean
     """
-    df_clean = df.copy()
+    # Shallow copy: assigning a column below replaces it in df_clean only,
+    # so untouched columns are shared with df instead of duplicated
+    df_clean = df.copy(deep=False)
     
-    # Only process specified columns
-    for col in columns_to_clean:
-        for placeholder in placeholder_list:
-            df_clean[col] = df_clean[col].replace(placeholder, pd.NA)
+    # Mask all placeholders across the specified columns, and only reassign
+    # the columns that actually contain a placeholder
+    mask = _placeholder_mask(df, columns_to_clean, _normalize_placeholders(placeholders))
+    for col in mask.columns[mask.any()]:
+        df_clean[col] = df[col].mask(mask[col], pd.NA)
     
     return df_clean
 
-def main():
-    # Set up command line arguments
-    parser = argparse.ArgumentParser(description='Clean placeholder strings from data files using Gemini API')
-    parser.add_argument('file_path', help='Path to the CSV or Excel file to clean')
-    parser.add_argument('--columns', nargs='+', help='Specific columns to check (optional)')
-    parser.add_argument('--output_dir', help='Directory to save cleaned files')
-    args = parser.parse_args()
+def _output_format(file_path, n_rows, output_format):
+    """
+    Resolve the output file format for a cleaned DataFrame
     
-    file_path = args.file_path
+    Args:
+        file_path (str): Path of the input file
+        n_rows (int): Number of rows in the cleaned DataFrame
+        output_format (str): One of 'auto', 'parquet', 'csv' or 'xlsx'
+    """
+    if output_format != 'auto':
+        return output_format
+    # Large outputs go to Parquet, which writes far faster than Excel or CSV
+    if n_rows > PARQUET_MIN_ROWS:
+        return 'parquet'
+    return 'csv' if file_path.endswith('.csv') else 'xlsx'
+
+def _save_dataframe(df, output_path, output_format):
+    """
+    Write a DataFrame in the given format
+    
+    Args:
+        df (pd.DataFrame): DataFrame to save
+        output_path (str): Destination file path
+        output_format (str): One of 'parquet', 'csv' or 'xlsx'
+    """
+    if output_format == 'parquet':
+        # Arrow needs one type per column, but object columns such as numeric
+        # measurements mixed with text markers ('<0.5') hold both, so store them as strings
+        mixed_cols = [col for col in df.select_dtypes(include='object').columns
+                      if pd.api.types.infer_dtype(df[col], skipna=True) in ('mixed', 'mixed-integer')]
+        if mixed_cols:
+            print(f"Writing mixed-type columns as strings: {mixed_cols}")
+            df = df.astype({col: 'string[pyarrow]' for col in mixed_cols})
+        df.to_parquet(output_path, engine='pyarrow', compression='zstd', index=False)
+    elif output_format == 'csv':
+        df.to_csv(output_path, index=False)
+    else:
+        # xlsxwriter is considerably faster than the default openpyxl writer
+        df.to_excel(output_path, index=False, engine='xlsxwriter')
+
+def process_file(file_path, columns=None, output_dir=None, output_format='auto', use_cache=True):
+    """
+    Identify and remove placeholder strings from one data file and save the results
     
+    Args:
+        file_path (str): Path to the CSV or Excel file to clean
+        columns (list): Specific columns to check (defaults to all string columns)
+        output_dir (str): Directory to save cleaned files
+        output_format (str): One of 'auto', 'parquet', 'csv' or 'xlsx'
+        use_cache (bool): Reuse cached Gemini responses for identical or similar value counts
+    """
     try:
-        # Load the data file based on extension
+        # Load the data file based on extension, using the multi-threaded Arrow
+        # CSV parser and the Rust-based calamine Excel reader
         if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(file_path, engine='pyarrow', dtype_backend='pyarrow')
         elif file_path.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file_path)
+            df = pd.read_excel(file_path, engine='calamine')
         else:
             raise ValueError("Unsupported file format. Please use CSV or Excel files.")
         
         # Specify columns
-        columns_to_check = args.columns if args.columns else df.select_dtypes(include=['object']).columns.tolist()
+        columns_to_check = columns if columns else df.select_dtypes(include=['object', 'string']).columns.tolist()
+        
+        # Strictly numeric columns can't hold placeholder strings, so skip them
+        # before they are converted to strings for the scans below
+        numeric_cols = [col for col in columns_to_check
+                        if col in df.columns and pd.api.types.is_numeric_dtype(df[col])]
+        if numeric_cols:
+            print(f"Skipping numeric columns: {numeric_cols}")
+            columns_to_check = [col for col in columns_to_check if col not in numeric_cols]
         
-        print(f"Analyzing {len(columns_to_check)} string columns for placeholders...")
+        print(f"{file_path}: analyzing {len(columns_to_check)} string columns for placeholders...")
         
         # Identify placeholder strings
-        placeholder_strings = identify_placeholder_strings(df, columns_to_check)
+        placeholder_strings = identify_placeholder_strings(df, columns_to_check, use_cache=use_cache)
         print("\nIdentified placeholder strings:")
         print(placeholder_strings)
         
+        # Normalize once for both the cleaning and the check below
+        placeholder_set = _normalize_placeholders(placeholder_strings)
+        
         # Clean the dataframe
-        df_clean = clean_dataframe(df, placeholder_strings, columns_to_check)
+        df_clean = clean_dataframe(df, placeholder_set, columns_to_check)
         
-        # Check cleaning
-        for col in columns_to_check:
-            remaining_placeholders = df_clean[col].isin(placeholder_strings).sum()
+        # Check cleaning, counting the remaining placeholders of all columns in one pass
+        remaining = _placeholder_mask(df_clean, columns_to_check, placeholder_set).sum()
+        for col, remaining_placeholders in remaining.items():
             print(f"\nColumn: {col}")
             print(f"Remaining placeholders: {remaining_placeholders}")
         
         # Save the cleaned dataframe
-        os.makedirs(args.output_dir, exist_ok=True)
-        output_path = os.path.join(args.output_dir, os.path.basename(file_path.rsplit('.', 1)[0]) + '_cleaned.' + file_path.rsplit('.', 1)[1])
-        if file_path.endswith('.csv'):
-            df_clean.to_csv(output_path, index=False)
-        else:
-            df_clean.to_excel(output_path, index=False)
+        os.makedirs(output_dir, exist_ok=True)
+        output_format = _output_format(file_path, len(df_clean), output_format)
+        output_path = os.path.join(output_dir, os.path.basename(file_path.rsplit('.', 1)[0]) + '_cleaned.' + output_format)
+        _save_dataframe(df_clean, output_path, output_format)
         print(f"\nCleaned data saved to: {output_path}")
         
         # Save placeholder strings to text file
-        placeholder_output_path = os.path.join(args.output_dir, os.path.basename(file_path.rsplit('.', 1)[0]) + '_placeholders_removed.txt')
+        placeholder_output_path = os.path.join(output_dir, os.path.basename(file_path.rsplit('.', 1)[0]) + '_placeholders_removed.txt')
         with open(placeholder_output_path, 'w') as f:
             f.write("Identified placeholder strings:\n")
             f.write('\n'.join(str(item) for item in placeholder_strings))
         print(f"Placeholder strings saved to: {placeholder_output_path}")
         
     except Exception as e:
-        print(f"An error occurred: {str(e)}")
+        print(f"An error occurred while processing {file_path}: {str(e)}")
+
+def _process_file_captured(file_path, **kwargs):
+    """
+    Run process_file and return its printed output instead of writing it to stdout
+    
+    Args:
+        file_path (str): Path to the CSV or Excel file to clean
+        **kwargs: Options passed on to process_file
+    """
+    # Each pool worker handles one file at a time, so redirecting its stdout
+    # keeps the output of files cleaned in parallel from interleaving
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        process_file(file_path, **kwargs)
+    return buffer.getvalue()
+
+def main():
+    # Set up command line arguments
+    parser = argparse.ArgumentParser(description='Clean placeholder strings from data files using Gemini API')
+    parser.add_argument('file_paths', nargs='+', help='Paths to the CSV or Excel files to clean')
+    parser.add_argument('--columns', nargs='+', help='Specific columns to check (optional)')
+    parser.add_argument('--output_dir', help='Directory to save cleaned files')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the cache of previous Gemini responses')
+    parser.add_argument('--format', choices=['auto', 'parquet', 'csv', 'xlsx'], default='auto',
+                        help='Output file format (default: input format, or Parquet for more than 100k rows)')
+    args = parser.parse_args()
+    
+    options = dict(columns=args.columns, output_dir=args.output_dir,
+                   output_format=args.format, use_cache=not args.no_cache)
+    if len(args.file_paths) == 1:
+        process_file(args.file_paths[0], **options)
+        return
+    
+    # Files are processed in separate processes; each failure is reported by
+    # process_file so one bad file doesn't abort the others. The cache
+    # directory is shared: cache files are replaced atomically and SQLite
+    # serializes writes to the semantic cache. Each file's output is printed
+    # as one block once it is done.
+    process = partial(_process_file_captured, **options)
+    with ProcessPoolExecutor(max_workers=min(MAX_WORKERS, len(args.file_paths))) as executor:
+        for file_path, output in zip(args.file_paths, executor.map(process, args.file_paths)):
+            print(f"\n===== {file_path} =====")
+            print(output, end='')
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,15 @@
+import os
+import sys
+import types
+
+# llm_clean_data.main configures Gemini at import time, so stub the SDK
+# for the offline tests and provide a dummy API key
+os.environ.setdefault('GOOGLE_API_KEY', 'test-key')
+
+genai_stub = types.ModuleType('google.generativeai')
+genai_stub.configure = lambda **kwargs: None
+genai_stub.GenerativeModel = lambda *args, **kwargs: None
+genai_stub.embed_content = lambda **kwargs: None
+google_stub = sys.modules.setdefault('google', types.ModuleType('google'))
+google_stub.generativeai = genai_stub
+sys.modules['google.generativeai'] = genai_stub
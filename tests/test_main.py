@@ -0,0 +1,455 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from llm_clean_data import main
+
+
+def test_batch_value_counts_splits_on_token_budget(monkeypatch):
+    monkeypatch.setattr(main, 'MAX_BATCH_TOKENS', 20)
+    value_counts = {
+        f'col{i}': {'numeric_examples': {'1.0': 3}, 'non_numeric_values': {'BLOD': 2}}
+        for i in range(5)
+    }
+    
+    batches = main._batch_value_counts(value_counts)
+    
+    assert len(batches) > 1
+    # Every column is sent exactly once, in order
+    assert [col for batch in batches for col in batch] == list(value_counts)
+    assert all(batch for batch in batches)
+
+
+def test_batch_value_counts_keeps_oversized_column_in_own_batch(monkeypatch):
+    monkeypatch.setattr(main, 'MAX_BATCH_TOKENS', 1)
+    value_counts = {'a': {'numeric_examples': {}, 'non_numeric_values': {'x' * 100: 2}}}
+    
+    assert main._batch_value_counts(value_counts) == [value_counts]
+
+
+def test_batch_value_counts_empty():
+    assert main._batch_value_counts({}) == []
+
+
+def test_clean_dataframe_replaces_placeholders():
+    df = pd.DataFrame({
+        'AB42': pd.Series([1.5, 'blod', 2.0, 'n/a'], dtype=object),
+        'SEX': pd.Series(['Male', 'Female', 'missing', 'Male'], dtype=object),
+        'ID': [1, 2, 3, 4],
+    })
+    original = df.copy()
+    
+    df_clean = main.clean_dataframe(df, ['blod', 'n/a', 'missing'], ['AB42', 'SEX'])
+    
+    assert df_clean['AB42'].isna().tolist() == [False, True, False, True]
+    assert df_clean['SEX'].isna().tolist() == [False, False, True, False]
+    assert df_clean['AB42'][0] == 1.5
+    pd.testing.assert_series_equal(df_clean['ID'], df['ID'])
+    # The input frame is left unmodified
+    pd.testing.assert_frame_equal(df, original)
+
+
+def test_clean_dataframe_without_matches_returns_equal_frame():
+    df = pd.DataFrame({'SEX': pd.Series(['Male', 'Female'], dtype=object)})
+    
+    df_clean = main.clean_dataframe(df, ['blod'], ['SEX'])
+    
+    pd.testing.assert_frame_equal(df_clean, df)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('["BLOD", "N/A"]', ['BLOD', 'N/A']),
+    ('[]', []),
+    ("['BLOD', 'N/A']", ['BLOD', 'N/A']),
+])
+def test_parse_placeholder_response(text, expected):
+    assert main._parse_placeholder_response(text) == expected
+
+
+@pytest.mark.parametrize('text', ['[1, null]', '{"a": "b"}', '"BLOD"'])
+def test_parse_placeholder_response_rejects_schema_violations(text):
+    with pytest.raises(ValueError):
+        main._parse_placeholder_response(text)
+
+
+@pytest.mark.parametrize('text', [
+    'Here are the placeholders: BLOD',
+    '{[1]: 2}',
+    '[' * 100000,
+])
+def test_parse_placeholder_response_rejects_malformed_text(text):
+    with pytest.raises(ValueError):
+        main._parse_placeholder_response(text)
+
+
+@pytest.mark.parametrize('file_path, n_rows, output_format, expected', [
+    ('data.csv', 10, 'auto', 'csv'),
+    ('data.xlsx', 10, 'auto', 'xlsx'),
+    ('data.xls', 10, 'auto', 'xlsx'),
+    ('data.xlsx', main.PARQUET_MIN_ROWS + 1, 'auto', 'parquet'),
+    ('data.csv', main.PARQUET_MIN_ROWS, 'auto', 'csv'),
+    ('data.xlsx', 10, 'csv', 'csv'),
+    ('data.csv', main.PARQUET_MIN_ROWS + 1, 'xlsx', 'xlsx'),
+])
+def test_output_format(file_path, n_rows, output_format, expected):
+    assert main._output_format(file_path, n_rows, output_format) == expected
+
+
+def test_column_fingerprint_ignores_counts_and_order():
+    counts = {'numeric_examples': {'1.0': 3}, 'non_numeric_values': {'BLOD': 2, 'N/A': 5}}
+    other_file = {'numeric_examples': {'7.5': 40}, 'non_numeric_values': {'N/A': 90, 'BLOD': 12}}
+    
+    assert main._column_fingerprint('AB42', counts) == main._column_fingerprint('AB42', other_file)
+
+
+def test_column_fingerprint_distinguishes_columns():
+    counts = {'numeric_examples': {'1.0': 3}, 'non_numeric_values': {'BLOD': 2}}
+    fingerprint = main._column_fingerprint('AB42', counts)
+    
+    assert main._column_fingerprint('AB40', counts) != fingerprint
+    assert main._column_fingerprint(
+        'AB42', {'numeric_examples': {'1.0': 3}, 'non_numeric_values': {'BLOD': 2, 'M_PI': 2}}
+    ) != fingerprint
+    assert main._column_fingerprint(
+        'AB42', {'numeric_examples': {}, 'non_numeric_values': {'BLOD': 2}}
+    ) != fingerprint
+
+
+def test_clean_dataframe_matches_case_and_whitespace_variants():
+    df = pd.DataFrame({'AB42': pd.Series([1.5, 'BLOD', 'blod ', ' N/A', 'Male'], dtype=object)})
+    
+    df_clean = main.clean_dataframe(df, ['BLOD', 'N/A'], ['AB42'])
+    
+    assert df_clean['AB42'].isna().tolist() == [False, True, True, True, False]
+
+
+def test_cache_path_accepts_mixed_type_column_names():
+    counts = {'numeric_examples': {}, 'non_numeric_values': {'BLOD': 2}}
+    
+    path = main._cache_path({'Sex': counts, 2019: counts})
+    
+    assert path == main._cache_path({2019: counts, 'Sex': counts})
+    assert path != main._cache_path({'Sex': counts})
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(main, 'SEMANTIC_CACHE_PATH', str(tmp_path / 'semantic.sqlite'))
+    monkeypatch.setattr(main, 'COLUMN_CACHE_PATH', str(tmp_path / 'col_index.sqlite'))
+    return tmp_path
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """Record the batches sent to Gemini and answer each with 'BLOD'"""
+    calls = []
+    
+    def query_batches(batches):
+        calls.append(batches)
+        return [['BLOD'] for _ in batches]
+    
+    monkeypatch.setattr(main, '_query_batches', query_batches)
+    monkeypatch.setattr(main, '_embed_signature', lambda value_counts: np.array([1.0, 0.0], dtype=np.float32))
+    return calls
+
+
+VALUE_COUNTS = {'AB42': {'numeric_examples': {'1.5': 3}, 'non_numeric_values': {'BLOD': 4}}}
+
+
+def test_query_schema_reuses_exact_cache(cache_dir, fake_gemini):
+    assert main._query_schema(VALUE_COUNTS) == ['BLOD']
+    assert main._query_schema(VALUE_COUNTS) == ['BLOD']
+    
+    assert len(fake_gemini) == 1
+    assert os.path.exists(main._cache_path(VALUE_COUNTS))
+
+
+def test_query_schema_without_cache_always_queries(cache_dir, fake_gemini):
+    main._query_schema(VALUE_COUNTS, use_cache=False)
+    main._query_schema(VALUE_COUNTS, use_cache=False)
+    
+    assert len(fake_gemini) == 2
+    assert not os.listdir(cache_dir)
+
+
+def test_semantic_hit_is_not_copied_to_exact_cache(cache_dir, fake_gemini):
+    main._query_schema(VALUE_COUNTS)
+    similar = {'AB40': {'numeric_examples': {'2.5': 1}, 'non_numeric_values': {'BLOD': 9}}}
+    
+    assert main._query_schema(similar) == ['BLOD']
+    
+    assert len(fake_gemini) == 1
+    assert not os.path.exists(main._cache_path(similar))
+
+
+def test_semantic_cache_ignores_other_versions(cache_dir, monkeypatch):
+    embedding = np.array([1.0, 0.0], dtype=np.float32)
+    main._save_semantic_cache(embedding, ['BLOD'])
+    assert main._lookup_semantic_cache(embedding) == ['BLOD']
+    
+    monkeypatch.setattr(main, 'SEMANTIC_CACHE_VERSION', 'other-prompt:other-model')
+    assert main._lookup_semantic_cache(embedding) is None
+
+
+def test_semantic_cache_migrates_unversioned_database(cache_dir):
+    conn = sqlite3.connect(main.SEMANTIC_CACHE_PATH)
+    conn.execute('CREATE TABLE signatures (embedding BLOB, placeholders TEXT, created REAL)')
+    conn.execute(
+        'INSERT INTO signatures VALUES (?, ?, ?)',
+        (np.array([1.0, 0.0], dtype=np.float32).tobytes(), '["OLD"]', time.time())
+    )
+    conn.commit()
+    conn.close()
+    
+    embedding = np.array([1.0, 0.0], dtype=np.float32)
+    assert main._lookup_semantic_cache(embedding) is None
+    main._save_semantic_cache(embedding, ['BLOD'])
+    assert main._lookup_semantic_cache(embedding) == ['BLOD']
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self._text = text
+    
+    @property
+    def text(self):
+        # Like the SDK, a blocked candidate has no text
+        if self._text is None:
+            raise ValueError("Response was blocked")
+        return self._text
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel that replies from a list of texts"""
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+    
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return FakeResponse(reply)
+
+
+def test_query_batches_works_inside_running_event_loop(monkeypatch):
+    async def notebook_cell():
+        return main._query_batches([{'a': {}}, {'b': {}}])
+    
+    # Run twice, like two files cleaned by the same pool worker
+    for _ in range(2):
+        monkeypatch.setattr(main, 'MODEL', FakeModel(['["BLOD"]', '["BLOD"]']))
+        assert asyncio.run(notebook_cell()) == [['BLOD'], ['BLOD']]
+
+
+def test_process_file_captured_returns_output(tmp_path):
+    output = main._process_file_captured('data.txt', output_dir=str(tmp_path))
+    
+    assert 'data.txt' in output
+    assert 'Unsupported file format' in output
+
+
+def test_main_prints_one_block_per_file(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr('sys.argv', ['llm_clean_data', 'a.txt', 'b.txt', '--output_dir', str(tmp_path)])
+    
+    main.main()
+    
+    out = capsys.readouterr().out
+    assert out.index('===== a.txt =====') < out.index('processing a.txt') < out.index('===== b.txt =====')
+    assert out.index('===== b.txt =====') < out.index('processing b.txt')
+
+
+@pytest.mark.parametrize('replies', [
+    ['not a list', '["BLOD"]'],
+    [None, '["BLOD"]'],
+    [RuntimeError('429 quota exceeded'), '["BLOD"]'],
+])
+def test_query_batch_retries_once(replies):
+    model = FakeModel(replies)
+    
+    assert main._query_batch(model, {'AB42': {}}) == ['BLOD']
+    assert len(model.prompts) == 2
+    assert model.prompts[1].endswith(main.RETRY_PROMPT_SUFFIX)
+
+
+@pytest.mark.parametrize('replies', [
+    ['not a list', '[1, null]'],
+    ['', None],
+    [RuntimeError('500 internal error'), '{[1]: 2}'],
+])
+def test_query_batch_returns_none_after_second_failure(replies):
+    assert main._query_batch(FakeModel(replies), {'AB42': {}}) is None
+
+
+def test_failed_batch_keeps_other_answers_and_skips_cache(cache_dir, monkeypatch):
+    monkeypatch.setattr(main, 'MAX_BATCH_TOKENS', 1)
+    monkeypatch.setattr(main, '_embed_signature', lambda value_counts: np.array([1.0, 0.0], dtype=np.float32))
+    
+    def query_batch(model, batch):
+        return None if 'AB40' in batch else ['BLOD']
+    
+    monkeypatch.setattr(main, '_query_batch', query_batch)
+    value_counts = {
+        'AB40': {'numeric_examples': {}, 'non_numeric_values': {'M_PI': 2}},
+        'AB42': {'numeric_examples': {}, 'non_numeric_values': {'BLOD': 2}},
+    }
+    
+    assert main._query_schema(value_counts) == ['BLOD']
+    assert not os.path.exists(main._cache_path(value_counts))
+
+
+def test_placeholder_mask_handles_missing_and_numeric_values():
+    df = pd.DataFrame({
+        'AB42': pd.Series([None, ' BLOD', 1.0, 'Blod'], dtype=object),
+        'AGE': [70, 71, None, 73],
+    })
+    
+    mask = main._placeholder_mask(df, ['AB42', 'AGE'], main._normalize_placeholders(['BLOD']))
+    
+    assert mask.columns.tolist() == ['AB42', 'AGE']
+    assert mask['AB42'].tolist() == [False, True, False, True]
+    assert mask['AGE'].tolist() == [False, False, False, False]
+
+
+@pytest.fixture
+def sent_to_gemini(monkeypatch):
+    """Capture the value counts passed on to Gemini and answer with 'M_PI'"""
+    calls = []
+    
+    def query_placeholders(value_counts, use_cache=True):
+        calls.append(value_counts)
+        return ['M_PI']
+    
+    monkeypatch.setattr(main, '_query_placeholders', query_placeholders)
+    return calls
+
+
+def test_identify_placeholder_strings_orders_counts_by_frequency(sent_to_gemini):
+    values = ['M_PI'] * 3 + ['M_OTHER_X'] * 5 + ['1.5'] * 2 + ['2'] * 4 + ['3e-2', None]
+    df = pd.DataFrame({'AB42': pd.Series(values, dtype=object)})
+    
+    assert main.identify_placeholder_strings(df, ['AB42']) == ['M_PI']
+    
+    [value_counts] = sent_to_gemini
+    counts = value_counts['AB42']
+    assert list(counts['non_numeric_values'].items()) == [('M_OTHER_X', 5), ('M_PI', 3)]
+    assert list(counts['numeric_examples'].items()) == [('2', 4), ('1.5', 2), ('3e-2', 1)]
+
+
+def test_identify_placeholder_strings_collects_known_singletons_without_gemini(sent_to_gemini):
+    df = pd.DataFrame({'AB42': pd.Series([1.5, 'BLOD', 2.0, 3.0, 'N/A'], dtype=object)})
+    
+    assert main.identify_placeholder_strings(df, ['AB42']) == ['BLOD', 'N/A']
+    assert sent_to_gemini == []
+
+
+def test_identify_placeholder_strings_skips_columns_of_unknown_singletons(sent_to_gemini, capsys):
+    df = pd.DataFrame({
+        'NOTES': pd.Series(['fasting', 'retest', 'hemolyzed'], dtype=object),
+        'AGE': [70, 71, 72],
+    })
+    
+    assert main.identify_placeholder_strings(df, ['NOTES', 'AGE']) == []
+    assert sent_to_gemini == []
+    assert 'No candidate placeholder values found' in capsys.readouterr().out
+
+
+def test_identify_placeholder_strings_sends_repeated_unknowns_with_known_ones(sent_to_gemini):
+    df = pd.DataFrame({'AB42': pd.Series(['M_PI', 'M_PI', 'missing', 1.5], dtype=object)})
+    
+    assert main.identify_placeholder_strings(df, ['AB42']) == ['M_PI', 'missing']
+    assert list(sent_to_gemini[0]['AB42']['non_numeric_values']) == ['M_PI', 'missing']
+
+
+def test_identify_placeholder_strings_caps_non_numeric_values(sent_to_gemini):
+    values = [f'code_{i}' for i in range(main.MAX_NON_NUMERIC_VALUES + 10) for _ in range(i + 2)]
+    df = pd.DataFrame({'CODE': pd.Series(values, dtype=object)})
+    
+    main.identify_placeholder_strings(df, ['CODE'])
+    
+    sent = sent_to_gemini[0]['CODE']['non_numeric_values']
+    assert len(sent) == main.MAX_NON_NUMERIC_VALUES
+    # The most frequent values are kept
+    assert 'code_59' in sent and 'code_0' not in sent
+
+
+def test_identify_placeholder_strings_rejects_unknown_columns():
+    with pytest.raises(ValueError):
+        main.identify_placeholder_strings(pd.DataFrame({'A': [1]}), ['B'])
+
+
+def test_column_cache_round_trip_attributes_normalized_placeholders(cache_dir):
+    value_counts = {
+        'AB42': {'numeric_examples': {'1.5': 3}, 'non_numeric_values': {'n/a ': 3, 'M_PI': 2}},
+        'SEX': {'numeric_examples': {}, 'non_numeric_values': {'Male': 9, 'Female': 8}},
+    }
+    
+    main._save_column_cache(value_counts, ['N/A', 'M_PI'])
+    placeholders, missing = main._lookup_column_cache(value_counts)
+    
+    assert placeholders == {'n/a ', 'M_PI'}
+    assert missing == {}
+
+
+def test_column_cache_returns_only_unseen_columns(cache_dir):
+    seen = {'AB42': {'numeric_examples': {}, 'non_numeric_values': {'BLOD': 2}}}
+    unseen = {'AB40': {'numeric_examples': {}, 'non_numeric_values': {'M_OTHER': 2}}}
+    main._save_column_cache(seen, ['BLOD'])
+    
+    placeholders, missing = main._lookup_column_cache({**seen, **unseen})
+    
+    assert placeholders == {'BLOD'}
+    assert missing == unseen
+
+
+def test_query_placeholders_only_sends_uncached_columns(cache_dir, fake_gemini, monkeypatch):
+    first = {'AB42': {'numeric_examples': {}, 'non_numeric_values': {'BLOD': 2}}}
+    second = {
+        'AB42': {'numeric_examples': {}, 'non_numeric_values': {'BLOD': 7}},
+        'AB40': {'numeric_examples': {}, 'non_numeric_values': {'M_OTHER': 2}},
+    }
+    # Dissimilar signatures, so the second query can't be a semantic hit
+    embeddings = iter([np.array([1.0, 0.0]), np.array([0.0, 1.0])])
+    monkeypatch.setattr(main, '_embed_signature', lambda value_counts: next(embeddings))
+    
+    main._query_placeholders(first)
+    main._query_placeholders(second)
+    
+    assert [list(batches[0]) for batches in fake_gemini] == [['AB42'], ['AB40']]
+
+
+def test_semantic_hit_does_not_fill_column_cache(cache_dir, fake_gemini):
+    main._query_schema(VALUE_COUNTS)
+    similar = {'AB40': {'numeric_examples': {}, 'non_numeric_values': {'BLOD': 9}}}
+    
+    main._query_schema(similar)
+    
+    assert main._lookup_column_cache(similar)[1] == similar
+
+
+def test_process_file_skips_numeric_columns(tmp_path, monkeypatch, capsys):
+    data_path = tmp_path / 'biomarkers.csv'
+    pd.DataFrame({'AGE': [70, 71, 72], 'SEX': ['Male', 'MISSING', 'Female']}).to_csv(data_path, index=False)
+    checked = []
+    
+    def identify_placeholder_strings(df, columns_to_check, use_cache=True):
+        checked.extend(columns_to_check)
+        return ['MISSING']
+    
+    monkeypatch.setattr(main, 'identify_placeholder_strings', identify_placeholder_strings)
+    output_dir = tmp_path / 'out'
+    
+    main.process_file(str(data_path), columns=['AGE', 'SEX'], output_dir=str(output_dir), use_cache=False)
+    
+    assert checked == ['SEX']
+    assert "Skipping numeric columns: ['AGE']" in capsys.readouterr().out
+    df_clean = pd.read_csv(output_dir / 'biomarkers_cleaned.csv')
+    assert df_clean['AGE'].tolist() == [70, 71, 72]
+    assert df_clean['SEX'].isna().tolist() == [False, True, False]